@@ -1,5 +1,6 @@
 from sys import exception, prefix
-from fastapi import FastAPI, HTTPException,File,UploadFile,Form,Depends,HTTPException
+from fastapi import FastAPI, HTTPException,File,UploadFile,Form,Depends,HTTPException,Request,Response
+from fastapi.responses import JSONResponse
 from sqlalchemy import select
 from app.schemas import PostCreate,PostResponse
 from app.db import Post,create_db_tables,get_async_session,User
@@ -11,6 +12,8 @@ import shutil
 import os
 import uuid
 import tempfile
+import hashlib
+import json
 from app.users import auth_backend, current_active_user, fastapi_users
 from app.schemas import UserRead,UserCreate,UserUpdate
 
@@ -66,6 +69,7 @@ async def upload_file(file: UploadFile = File(...),
         
 @app.get('/feed')
 async def get_feed(
+        request: Request,
         session:AsyncSession = Depends(get_async_session),
         user: User = Depends(current_active_user),
 
@@ -91,7 +95,11 @@ async def get_feed(
              "email":user_dict.get(post.user_id,"Unknown"),
              }
         )
-    return {"posts": posts_data}
+
+    etag = '"' + hashlib.sha1(json.dumps(posts_data, sort_keys=True).encode("utf-8")).hexdigest() + '"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse({"posts": posts_data}, headers={"ETag": etag})
 
 @app.delete('/posts/{post_id}')
 async def delete_post(post_id:str,
@@ -1,28 +1,59 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 import base64
-import urllib.parse
+import collections
+import html
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from image_urls import create_transformed_url
 
 # -----------------------
 # Config
 # -----------------------
 API_BASE = "http://localhost:8000"  # change for production
+logger = logging.getLogger(__name__)
 st.set_page_config(page_title="Simple Social", layout="wide")
 
+@st.cache_resource
+def get_session():
+    """HTTP session shared by all user sessions so calls reuse pooled keep-alive connections.
+    Auth headers are passed per call; never store the token on the session headers.
+    Idempotent GETs are retried with backoff on gateway errors; each attempt keeps the call's timeout."""
+    session = requests.Session()
+    session.headers.update({"User-Agent": "simple-social-ui"})
+    # Ignore Retry-After: a 503 asking for minutes would otherwise stall the script thread far past the timeout
+    retry = Retry(total=3, backoff_factor=0.2, status_forcelist=[502, 503, 504], allowed_methods={"GET"},
+                  respect_retry_after_header=False)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+@st.cache_resource
+def get_pool():
+    """Thread pool for overlapping independent backend calls (shared across sessions)"""
+    return ThreadPoolExecutor(max_workers=8)
+
+@st.cache_resource
+def upload_sem():
+    """Caps concurrent uploads across all user sessions so the backend isn't stampeded"""
+    return threading.BoundedSemaphore(4)
+
 # -----------------------
 # Session initialization
 # -----------------------
-if 'token' not in st.session_state:
-    st.session_state.token = None
-if 'user' not in st.session_state:
-    st.session_state.user = None
-if 'last_token_check_failed' not in st.session_state:
-    st.session_state.last_token_check_failed = False
+for key, default in {"token": None, "user": None, "last_token_check_failed": False, "user_refresh": None}.items():
+    st.session_state.setdefault(key, default)
 
 # Try to restore token from URL query params (survives reloads)
-query_params = st.experimental_get_query_params()
+query_params = st.query_params
 if not st.session_state.token and 'token' in query_params:
-    st.session_state.token = query_params.get('token')[0]
+    st.session_state.token = query_params['token']
 
 def get_headers():
     """Get authorization headers with token"""
@@ -30,19 +61,66 @@ def get_headers():
         return {"Authorization": f"Bearer {st.session_state.token}"}
     return {}
 
+@st.cache_data(ttl=300, show_spinner=False)
+def fetch_me(token):
+    """Fetch the current user for a token (cached per token so reruns skip the round-trip)"""
+    response = get_session().get(f"{API_BASE}/users/me", headers={"Authorization": f"Bearer {token}"}, timeout=5)
+    response.raise_for_status()
+    return response.json()
+
+def decode_token(token):
+    """Read a JWT payload without verifying it - UI hydration only, the backend still verifies"""
+    try:
+        payload = token.split(".")[1]
+        data = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+    except Exception:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+def is_unauthorized(error):
+    """True if an HTTPError means the backend rejected the token (other statuses are transient)"""
+    return error.response is not None and error.response.status_code == 401
+
+def drop_rejected_token():
+    """Token was rejected by the backend -> clear it from state & URL so the user logs in again"""
+    fetch_me.clear()
+    st.session_state.token = None
+    st.session_state.user = None
+    st.session_state.user_refresh = None
+    st.query_params.clear()  # clear token from URL
+
+# Apply the result of a background /users/me refresh started on an earlier run
+refresh = st.session_state.user_refresh
+if refresh is not None and refresh.done():
+    st.session_state.user_refresh = None
+    try:
+        st.session_state.user = refresh.result()
+    except requests.HTTPError as e:
+        if is_unauthorized(e):
+            drop_rejected_token()
+        # other statuses: backend hiccup; keep the hydrated user, API calls will surface errors
+    except Exception:
+        pass  # backend unreachable; keep the hydrated user, API calls will surface errors
+
 # If we have a token but no user object, attempt to fetch user info.
 # This runs once on page load (or whenever session_state.token is set and user is None).
-if st.session_state.token and st.session_state.user is None and not st.session_state.last_token_check_failed:
+# An unexpired JWT carrying the email hydrates the user directly; /users/me is then only
+# refreshed in the background and a rejected token is dropped on a later run.
+token_payload = decode_token(st.session_state.token) if st.session_state.token else {}
+token_exp = token_payload.get("exp")
+if (st.session_state.user is None and token_payload.get("email") and token_payload.get("sub")
+        and isinstance(token_exp, (int, float)) and token_exp > time.time()):
+    st.session_state.user = {"id": token_payload["sub"], "email": token_payload["email"]}
+    st.session_state.user_refresh = get_pool().submit(fetch_me, st.session_state.token)
+elif st.session_state.token and st.session_state.user is None and not st.session_state.last_token_check_failed:
     try:
-        user_response = requests.get(f"{API_BASE}/users/me", headers=get_headers(), timeout=5)
-        if user_response.status_code == 200:
-            st.session_state.user = user_response.json()
-        else:
+        st.session_state.user = fetch_me(st.session_state.token)
+    except requests.HTTPError as e:
+        if is_unauthorized(e):
             # token invalid or expired -> clear token from state & URL
-            st.session_state.token = None
-            st.session_state.user = None
-            st.experimental_set_query_params()  # clear token from URL
-            st.session_state.last_token_check_failed = True
+            drop_rejected_token()
+        # otherwise backend error, avoid repeated failing attempts this run
+        st.session_state.last_token_check_failed = True
     except Exception:
         # network or backend down, avoid repeated failing attempts this run
         st.session_state.last_token_check_failed = True
@@ -50,29 +128,66 @@ if st.session_state.token and st.session_state.user is None and not st.session_s
 # -----------------------
 # Utility helpers
 # -----------------------
-def encode_text_for_overlay(text):
-    """Encode text for ImageKit overlay - base64 then URL encode"""
-    if not text:
-        return ""
-    base64_text = base64.b64encode(text.encode('utf-8')).decode('utf-8')
-    return urllib.parse.quote(base64_text)
-
-def create_transformed_url(original_url, transformation_params, caption=None):
-    if caption:
-        encoded_caption = encode_text_for_overlay(caption)
-        text_overlay = f"l-text,ie-{encoded_caption},ly-N20,lx-20,fs-100,co-white,bg-000000A0,l-end"
-        transformation_params = text_overlay
-
-    if not transformation_params:
-        return original_url
-
-    parts = original_url.split("/")
-    if len(parts) < 5:
-        return original_url
-    imagekit_id = parts[3]
-    file_path = "/".join(parts[4:])
-    base_url = "/".join(parts[:4])
-    return f"{base_url}/tr:{transformation_params}/{file_path}"
+FEED_ETAG_CACHE_SIZE = 128
+
+class FeedEtagStore:
+    """Thread-safe LRU of the last (etag, posts) seen per token, bounded so stale tokens get evicted"""
+
+    def __init__(self, maxsize=FEED_ETAG_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None, None
+            self._entries.move_to_end(token)
+            return entry
+
+    def put(self, token, etag, posts):
+        with self._lock:
+            self._entries[token] = (etag, posts)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+@st.cache_resource
+def _feed_etags():
+    """Shared across sessions; survives load_feed.clear() so refreshes can be conditional"""
+    return FeedEtagStore()
+
+# st.cache_data already serialises concurrent misses for the same token (per-key compute lock
+# plus a re-check), so identical in-flight /feed calls are coalesced without extra locking here.
+@st.cache_data(ttl=30, show_spinner=False)
+def load_feed(token):
+    """Fetch the feed posts for a token (cached briefly; cleared after upload/delete)"""
+    headers = {"Authorization": f"Bearer {token}"}
+    etag, cached_posts = _feed_etags().get(token)
+    if etag:
+        headers["If-None-Match"] = etag
+    response = get_session().get(f"{API_BASE}/feed", headers=headers, timeout=8)
+    if response.status_code == 304:
+        return cached_posts
+    response.raise_for_status()
+    posts = response.json().get("posts", [])
+    if response.headers.get("ETag"):
+        _feed_etags().put(token, response.headers["ETag"], posts)
+    return posts
+
+def _prefetch_feed(token):
+    """Populate load_feed's cache ahead of feed_page; failures resurface when the feed renders"""
+    try:
+        load_feed(token)
+    except Exception:
+        logger.warning("Feed prefetch failed", exc_info=True)
+
+# Feed post templates (images are lazy-loaded so off-screen posts don't fetch until scrolled to)
+POST_HEADER_HTML = "<hr><b>{email}</b> • {date}"
+POST_IMAGE_HTML = '<br><img src="{url}" width="300" loading="lazy">'
+# Videos show an ImageKit poster frame and only download once the user presses play
+POST_VIDEO_HTML = '<br><video src="{url}" poster="{poster}" preload="none" controls width="300"></video><br><small>{caption}</small>'
 
 # -----------------------
 # Pages
@@ -90,7 +205,7 @@ def login_page():
             if st.button("Login", type="primary", use_container_width=True):
                 login_data = {"username": email, "password": password}
                 try:
-                    response = requests.post(f"{API_BASE}/auth/jwt/login", data=login_data, timeout=8)
+                    response = get_session().post(f"{API_BASE}/auth/jwt/login", data=login_data, timeout=8)
                 except Exception:
                     st.error("Could not contact backend. Is the API running?")
                     return
@@ -98,17 +213,20 @@ def login_page():
                 if response.status_code == 200:
                     token_data = response.json()
                     st.session_state.token = token_data["access_token"]
+                    # Warm the feed cache in the background; no need to wait for it
+                    get_pool().submit(_prefetch_feed, st.session_state.token)
 
                     # Persist token to URL so it survives reloads (dev-only; not secure for production)
-                    st.experimental_set_query_params(token=st.session_state.token)
+                    st.query_params["token"] = st.session_state.token
 
-                    # Immediately fetch the user
-                    user_response = requests.get(f"{API_BASE}/users/me", headers=get_headers())
-                    if user_response.status_code == 200:
-                        st.session_state.user = user_response.json()
-                        st.rerun()
-                    else:
+                    # Fetch the user on this thread while the feed prefetch runs; queuing it on the
+                    # shared pool could push it behind other sessions' prefetches and retries
+                    try:
+                        st.session_state.user = fetch_me(st.session_state.token)
+                    except Exception:
                         st.error("Failed to get user info")
+                    else:
+                        st.rerun()
                 else:
                     st.error("Invalid email or password!")
 
@@ -116,7 +234,7 @@ def login_page():
             if st.button("Sign Up", type="secondary", use_container_width=True):
                 signup_data = {"email": email, "password": password}
                 try:
-                    response = requests.post(f"{API_BASE}/auth/register", json=signup_data, timeout=8)
+                    response = get_session().post(f"{API_BASE}/auth/register", json=signup_data, timeout=8)
                 except Exception:
                     st.error("Could not contact backend. Is the API running?")
                     return
@@ -140,16 +258,31 @@ def upload_page():
 
     if uploaded_file and st.button("Share", type="primary"):
         with st.spinner("Uploading..."):
-            files = {"file": (uploaded_file.name, uploaded_file.getvalue(), uploaded_file.type)}
+            # requests reads the file and builds the whole multipart body in memory; passing the
+            # file object instead of getvalue() is just tidier, it does not lower peak memory
+            uploaded_file.seek(0)
+            files = {"file": (uploaded_file.name, uploaded_file, uploaded_file.type)}
             data = {"caption": caption}
+            slots = upload_sem()
+            acquired = False
+            # The spinner can raise a rerun/stop on exit, so release in finally only what we took
             try:
-                response = requests.post(f"{API_BASE}/upload", files=files, data=data, headers=get_headers(), timeout=30)
-            except Exception:
-                st.error("Upload failed: cannot contact backend.")
-                return
+                acquired = slots.acquire(blocking=False)
+                if not acquired:
+                    with st.spinner("Waiting for upload slot..."):
+                        acquired = slots.acquire()
+                try:
+                    response = get_session().post(f"{API_BASE}/upload", files=files, data=data, headers=get_headers(), timeout=30)
+                except Exception:
+                    st.error("Upload failed: cannot contact backend.")
+                    return
+            finally:
+                if acquired:
+                    slots.release()
 
             if response.status_code == 200:
                 st.success("Posted!")
+                load_feed.clear()
                 st.rerun()
             else:
                 try:
@@ -162,50 +295,67 @@ def feed_page():
     st.title("🏠 Feed")
 
     try:
-        response = requests.get(f"{API_BASE}/feed", headers=get_headers(), timeout=8)
+        posts = load_feed(st.session_state.token)
+    except requests.HTTPError as e:
+        if is_unauthorized(e):
+            # token no longer accepted (user removed, DB reset, ...) -> back to login
+            drop_rejected_token()
+            st.rerun()
+        st.error("Failed to load feed")
+        return
     except Exception:
         st.error("Failed to contact backend. Is the API running?")
         return
 
-    if response.status_code == 200:
-        posts = response.json().get("posts", [])
-        if not posts:
-            st.info("No posts yet! Be the first to share something.")
-            return
-
-        for post in posts:
-            st.markdown("---")
-            col1, col2 = st.columns([4, 1])
-            with col1:
-                st.markdown(f"**{post.get('email','Unknown')}** • {post.get('created_at','')[:10]}")
-            with col2:
-                if post.get('is_owner', False):
-                    if st.button("🗑️", key=f"delete_{post['id']}", help="Delete post"):
-                        try:
-                            resp = requests.delete(f"{API_BASE}/posts/{post['id']}", headers=get_headers(), timeout=8)
-                        except Exception:
-                            st.error("Failed to contact backend.")
-                            continue
-
-                        if resp.status_code == 200:
-                            st.success("Post deleted!")
-                            st.rerun()
-                        else:
-                            st.error("Failed to delete post!")
-
-            caption = post.get('caption', '')
-            if post.get('file_type') == 'image':
-                uniform_url = create_transformed_url(post.get('url', ''), "", caption)
-                st.image(uniform_url, width=300)
-            else:
-                uniform_video_url = create_transformed_url(post.get('url', ''), "w-400,h-200,cm-pad_resize,bg-blurred")
-                st.video(uniform_video_url, width=300)
-                st.caption(caption)
+    st.session_state.feed_posts = list(posts)
+    _feed_fragment()
 
-            st.markdown("")
+@st.fragment
+def _feed_fragment():
+    """Render the post list; deleting a post reruns only this fragment, not the whole page"""
+    posts = st.session_state.feed_posts
+    if not posts:
+        st.info("No posts yet! Be the first to share something.")
+        return
 
-    else:
-        st.error("Failed to load feed")
+    for post in posts:
+        caption = post.get('caption') or ''
+        # Static parts of a post go out as one markdown blob; only the delete button is a widget
+        post_html = POST_HEADER_HTML.format(
+            email=html.escape(post.get('email', 'Unknown')),
+            date=html.escape(post.get('created_at', '')[:10]),
+        )
+        if post.get('file_type') == 'image':
+            uniform_url = create_transformed_url(post.get('url', ''), "w-600,q-auto,f-auto", caption)
+            post_html += POST_IMAGE_HTML.format(url=html.escape(uniform_url))
+        else:
+            uniform_video_url = create_transformed_url(post.get('url', ''), "w-600,q-auto,f-auto")
+            poster_url = create_transformed_url(f"{post.get('url', '')}/ik-thumbnail.jpg", "so-1,w-600,q-auto,f-auto")
+            post_html += POST_VIDEO_HTML.format(
+                url=html.escape(uniform_video_url),
+                poster=html.escape(poster_url),
+                caption=html.escape(caption),
+            )
+
+        col1, col2 = st.columns([4, 1])
+        with col1:
+            st.markdown(post_html, unsafe_allow_html=True)
+        with col2:
+            if post.get('is_owner', False):
+                if st.button("🗑️", key=f"delete_{post['id']}", help="Delete post"):
+                    try:
+                        resp = get_session().delete(f"{API_BASE}/posts/{post['id']}", headers=get_headers(), timeout=8)
+                    except Exception:
+                        st.error("Failed to contact backend.")
+                        continue
+
+                    if resp.status_code == 200:
+                        st.success("Post deleted!")
+                        load_feed.clear()
+                        st.session_state.feed_posts = [p for p in posts if p['id'] != post['id']]
+                        st.rerun(scope="fragment")
+                    else:
+                        st.error("Failed to delete post!")
 
 # -----------------------
 # Main app logic
@@ -220,7 +370,8 @@ else:
         # Clear session & URL token
         st.session_state.user = None
         st.session_state.token = None
-        st.experimental_set_query_params()  # clear query params (remove token)
+        st.session_state.user_refresh = None
+        st.query_params.clear()  # clear query params (remove token)
         st.rerun()
 
     st.sidebar.markdown("---")
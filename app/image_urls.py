@@ -0,0 +1,55 @@
+import base64
+import functools
+import urllib.parse
+
+# Kept out of frontend.py: Streamlit re-executes the script in a fresh module on every rerun,
+# while imported modules persist, so these lru_caches survive reruns.
+
+IMAGEKIT_PREFIX = "https://ik.imagekit.io/"
+
+@functools.lru_cache(maxsize=1024)
+def encode_text_for_overlay(text):
+    """Encode text for ImageKit overlay - base64 then URL encode (bytes-only, no intermediate str)
+
+    '/' must be escaped too, otherwise it would split the tr: path segment:
+
+    >>> encode_text_for_overlay("hi")
+    'aGk%3D'
+    >>> encode_text_for_overlay("???")
+    'Pz8%2F'
+    """
+    if not text:
+        return ""
+    return urllib.parse.quote_from_bytes(base64.b64encode(text.encode('utf-8')), safe='')
+
+@functools.lru_cache(maxsize=1024)
+def create_transformed_url(original_url, transformation_params, caption=None):
+    """Build an ImageKit transformation URL (memoized: a pure function of its arguments)
+
+    Keep this deterministic - no per-run cache busters - so the same post always maps to the
+    same URL and ImageKit's immutable CDN/browser caching keeps hitting across sessions.
+    """
+    if caption:
+        encoded_caption = encode_text_for_overlay(caption)
+        # Sized for the 600px feed rendition (fs-100 was tuned for full-resolution originals)
+        text_overlay = f"l-text,ie-{encoded_caption},ly-N10,lx-10,fs-32,co-white,bg-000000A0,l-end"
+        # Chained step (':') so the caption is drawn after the resize, not scaled along with it
+        transformation_params = f"{transformation_params}:{text_overlay}" if transformation_params else text_overlay
+
+    if not transformation_params:
+        return original_url
+
+    if original_url.startswith(IMAGEKIT_PREFIX):
+        imagekit_id, _, file_path = original_url[len(IMAGEKIT_PREFIX):].partition("/")
+        if not file_path:
+            return original_url
+        return f"{IMAGEKIT_PREFIX}{imagekit_id}/tr:{transformation_params}/{file_path}"
+
+    # Custom URL endpoints: fall back to splitting the path
+    parts = original_url.split("/")
+    if len(parts) < 5:
+        return original_url
+    imagekit_id = parts[3]
+    file_path = "/".join(parts[4:])
+    base_url = "/".join(parts[:4])
+    return f"{base_url}/tr:{transformation_params}/{file_path}"
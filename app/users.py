@@ -4,6 +4,7 @@ from fastapi import Depends, Request
 from fastapi_users import BaseUserManager,FastAPIUsers, UUIDIDMixin, models
 from fastapi_users.authentication import (AuthenticationBackend,BearerTransport,JWTStrategy)
 from fastapi_users.db import SQLAlchemyUserDatabase
+from fastapi_users.jwt import generate_jwt
 from app.db import User, get_user_db
 
 
@@ -32,8 +33,14 @@ async def get_user_manager(user_db:SQLAlchemyUserDatabase = Depends(get_user_db)
 
 bearer_transport = BearerTransport(tokenUrl="auth/jwt/login")
 
+class EmailJWTStrategy(JWTStrategy[models.UP, models.ID]):
+    # Also embed the email so the frontend can show the user without calling /users/me
+    async def write_token(self, user: models.UP) -> str:
+        data = {"sub": str(user.id), "email": user.email, "aud": self.token_audience}
+        return generate_jwt(data, self.encode_key, self.lifetime_seconds, algorithm=self.algorithm)
+
 def get_jwt_strategy():
-    return JWTStrategy(secret=SECRET, lifetime_seconds=3600)
+    return EmailJWTStrategy(secret=SECRET, lifetime_seconds=3600)
 
 auth_backend = AuthenticationBackend(
     name="jwt",